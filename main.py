@@ -1,145 +1,515 @@
+import errno
 import http.server
-import socketserver
 import os
+import functools
+import json
+import multiprocessing
+import secrets
+import shutil
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
 import urllib.parse
 import zipfile
-import io
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from PIL import Image  # Import the Pillow library for image manipulation
 
 PORT = 8010
+CHUNK_SIZE = 64 * 1024  # Read uploads from the socket 64KB at a time
+MAX_FILE_SIZE = 100 * 1024 * 1024  # Reject any single uploaded file larger than 100MB
+ZIP_COPY_BUFSIZE = 1024 * 1024  # Block size used when copying files into the download zip
+# Number of server processes; set to the core count in production so requests aren't
+# limited to the one core a single Python process can use (needs fork and SO_REUSEPORT)
+WORKERS = os.environ.get("WORKERS", "1")
+if not WORKERS.isdigit() or int(WORKERS) < 1:
+    raise SystemExit(f"WORKERS must be a positive integer, got {WORKERS!r}")
+WORKERS = int(WORKERS)
 
-# Set the path for the file storage
-upload_dir = r"C:\Users\saher\OneDrive\Desktop\projects\fileShare\uploads"
+JPEG_QUALITY = 85  # Quality used when converting uploaded PNGs to JPEG
+
+# Formats that are already compressed; deflating them again burns CPU for almost no gain
+PRECOMPRESSED = frozenset({'.png', '.jpg', '.jpeg', '.gif', '.webp', '.mp4', '.mp3', '.zip', '.docx', '.xlsx'})
+
+# Extensions used to group uploaded files by type
+IMAGE_EXTENSIONS = frozenset({'.png', '.jpg', '.jpeg'})
+DOCUMENT_EXTENSIONS = frozenset({'.pdf', '.txt', '.docx', '.xlsx'})
+MEDIA_EXTENSIONS = frozenset({'.mp4', '.mp3'})
+# Single lookup table from extension to category, built once
+EXTENSION_CATEGORY = {
+    **{ext: 'images' for ext in IMAGE_EXTENSIONS},
+    **{ext: 'documents' for ext in DOCUMENT_EXTENSIONS},
+    **{ext: 'media' for ext in MEDIA_EXTENSIONS},
+}
+
+# Set the path for the file storage; override with the UPLOAD_DIR environment variable.
+# Made absolute because the server chdirs into it below, and written back to the environment
+# so image workers (which re-import this module after that chdir) resolve the same directory.
+upload_dir = os.path.abspath(os.environ.get("UPLOAD_DIR", r"C:\Users\saher\OneDrive\Desktop\projects\fileShare\uploads"))
+os.environ["UPLOAD_DIR"] = upload_dir
 
 # Make sure the upload directory exists
 os.makedirs(upload_dir, exist_ok=True)  # Create the uploads directory if it doesn't exist
 os.chdir(upload_dir)
 
+# Convert a single PNG file to JPEG; kept at module level so worker processes can pickle it
+def convert_to_jpeg(png_path):
+    filename = os.path.basename(png_path)
+
+    try:
+        # Open the PNG once; a corrupt or truncated file raises from load() and is logged below
+        with Image.open(png_path) as img:
+            img.load()  # Decode the image data
+            img = img.convert('RGB')  # Convert to RGB (removes alpha channel if any)
+            # Never overwrite an existing photo.jpg; a taken name gets a random suffix instead
+            fd, jpg_path = create_upload_file(os.path.splitext(filename)[0] + '.jpg',
+                                              os.path.dirname(png_path))
+            try:
+                with open(fd, 'wb') as f:
+                    # Save as JPEG with fixed, fast encoder settings (4:2:0 chroma, no extra Huffman pass)
+                    img.save(f, 'JPEG', quality=JPEG_QUALITY, subsampling=2, optimize=False)
+            except BaseException:
+                os.remove(jpg_path)  # Don't leave a half-written JPEG behind
+                raise
+            print(f"Converted {filename} to {os.path.basename(jpg_path)}")
+
+        # Optionally delete the original PNG file after conversion
+        os.remove(png_path)
+        print(f"Deleted the original PNG file: {filename}")
+
+    except Exception as e:
+        # Log the error with the specific file causing the issue
+        print(f"Error converting {filename}: {e}")
+
+# Worker processes for converting uploaded images; created lazily so that each server
+# process gets its own pool, sized so that all of them together don't oversubscribe the CPU
+_image_pool = None
+_image_pool_lock = threading.Lock()
+POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+def get_image_pool():
+    global _image_pool
+    with _image_pool_lock:  # Request threads may race to create it
+        if _image_pool is None:
+            # This runs on a request thread, and fork()ing a multithreaded process can deadlock the
+            # child on a lock (e.g. stdout's) that another thread held at that moment. Start the
+            # workers from a clean forkserver process instead, or spawn them where that's missing.
+            _image_pool = ProcessPoolExecutor(max_workers=max(1, (os.cpu_count() or 1) // WORKERS),
+                                              mp_context=multiprocessing.get_context(POOL_START_METHOD))
+    return _image_pool
+
 # Function to convert all PNG files to JPEG
 def convert_png_to_jpeg():
-    for filename in os.listdir(upload_dir):
-        if filename.lower().endswith('.png'):
-            png_path = os.path.join(upload_dir, filename)
-            jpg_path = os.path.splitext(png_path)[0] + '.jpg'
+    png_paths = [os.path.join(upload_dir, filename)
+                 for filename in os.listdir(upload_dir) if file_extension(filename) == '.png']
+    # Decoding and encoding are CPU-bound, so fan the files out across all cores. This runs once
+    # before the server starts, so it uses its own pool that is shut down before any forking.
+    with ProcessPoolExecutor() as executor:
+        list(executor.map(convert_to_jpeg, png_paths))
 
-            try:
-                # Try opening the PNG file with Pillow to check if it's valid
-                with Image.open(png_path) as img:
-                    img.verify()  # Verify that the image is valid
-                    img = Image.open(png_path)  # Re-open the image after verifying it
-                    img = img.convert('RGB')  # Convert to RGB (removes alpha channel if any)
-                    img.save(jpg_path, 'JPEG')  # Save the image as JPEG
-                    print(f"Converted {filename} to {os.path.basename(jpg_path)}")
+# Hand a freshly uploaded PNG to the pool so it converts while the rest of the request arrives
+def queue_conversion(path):
+    global _image_pool
+    if file_extension(os.path.basename(path)) == '.png':
+        pool = get_image_pool()
+        try:
+            pool.submit(convert_to_jpeg, path)
+        except Exception as e:
+            # The upload itself is fine; the PNG just stays unconverted
+            print(f"Error queueing conversion of {os.path.basename(path)}: {e}")
+            if isinstance(e, BrokenProcessPool):
+                # A worker died (OOM kill, crash in a decoder); replace the pool for later uploads
+                with _image_pool_lock:
+                    if _image_pool is pool:
+                        _image_pool = None
+                pool.shutdown(wait=False)
+
+# Static parts of the upload page, built once at import time
+PAGE_HEAD = b'''\
+<html>
+<head>
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <style>
+        body { font-family: Arial, sans-serif; padding: 20px; }
+        h1 { text-align: center; }
+        form { margin-bottom: 20px; }
+        input[type="file"], input[type="submit"] { width: 100%; padding: 10px; margin: 10px 0; }
+        @media (min-width: 600px) {
+            input[type="file"], input[type="submit"] { width: auto; }
+        }
+        img { max-width: 100%; height: auto; }
+    </style>
+</head>
+<body>
+    <h1>File Sharing Service</h1>
+    <h2>Upload Files</h2>
+    <form action="/upload" method="post" enctype="multipart/form-data">
+        <input type="file" name="file" multiple>
+        <input type="submit" value="Upload">
+    </form>
+    <h2>View Uploaded Files</h2>
+    <h3>Images</h3>
+    <div>
+'''
+
+PAGE_TAIL = b'''\
+    </div>
+    <h2>Download Files</h2>
+    <form action="/download" method="get">
+        <input type="submit" value="Download All Files as ZIP">
+    </form>
+</body>
+</html>
+'''
 
-                # Optionally delete the original PNG file after conversion
-                os.remove(png_path)
-                print(f"Deleted the original PNG file: {filename}")
+# Lowercased extension of a file name including the dot, e.g. '.png', or '' if it has none.
+# Slices the name directly instead of going through os.path.splitext for every file.
+def file_extension(filename):
+    i = filename.rfind('.')
+    return filename[i:].lower() if i > 0 else ''
 
-            except Exception as e:
-                # Log the error with the specific file causing the issue
-                print(f"Error converting {filename}: {e}")
+# Group uploaded file names by type; cached until the upload directory changes
+def get_files_by_type():
+    # Adding, removing or renaming a file bumps the directory's mtime, which invalidates the cache
+    return _scan_upload_dir(os.stat(upload_dir).st_mtime_ns)
 
-# Call the conversion function when the server starts
-convert_png_to_jpeg()
+@functools.lru_cache(maxsize=1)
+def _scan_upload_dir(mtime_ns):
+    files = {'images': [], 'documents': [], 'media': [], 'other': []}
+    # scandir gets the file type from the directory listing itself, avoiding a stat per entry
+    with os.scandir(upload_dir) as entries:
+        for entry in entries:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            name = entry.name
+            files[EXTENSION_CATEGORY.get(file_extension(name), 'other')].append(name)
+    return files
+
+# JSON body for /files; encoded once per directory change rather than on every request
+def get_files_json():
+    return _encode_files_json(os.stat(upload_dir).st_mtime_ns)
+
+@functools.lru_cache(maxsize=1)
+def _encode_files_json(mtime_ns):
+    return json.dumps(_scan_upload_dir(mtime_ns)).encode()
+
+class FileTooLarge(Exception):
+    """Raised when an uploaded file exceeds MAX_FILE_SIZE."""
+
+
+def read_body(rfile, content_length):
+    """Yield the request body in CHUNK_SIZE pieces instead of reading it all at once."""
+    remaining = content_length
+    while remaining > 0:
+        chunk = rfile.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+def create_upload_file(filename, directory=None):
+    """Create a new file in directory (upload_dir by default) without overwriting an existing one.
+
+    O_EXCL makes the existence check and the create a single atomic syscall. If the name is
+    taken, a short random suffix is tried instead of probing name_1, name_2, ... one by one.
+    Returns the open file descriptor and the path that was created.
+    """
+    if directory is None:
+        directory = upload_dir
+    stem, suffix = os.path.splitext(filename)
+    name = filename
+    flags = os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, 'O_BINARY', 0)
+    for _ in range(8):
+        path = os.path.join(directory, name)  # Set the file path to the new directory
+        try:
+            return os.open(path, flags, 0o644), path
+        except FileExistsError:
+            name = f"{stem}_{secrets.token_hex(3)}{suffix}"
+    raise FileExistsError(f"Could not find a free name for {filename}")
+
+def save_multipart(chunks, boundary, on_saved=None):
+    """Parse a multipart/form-data body incrementally and write each file part to disk.
+
+    Only a delimiter-sized tail is kept in memory between chunks, so memory use stays
+    flat regardless of upload size. on_saved, if given, is called with each file's path
+    as soon as that part is complete. Returns the list of saved file paths.
+    """
+    delimiter = b'\r\n--' + boundary
+    buf = b'\r\n'  # Lets the very first boundary match the same delimiter
+    state = 'preamble'
+    saved = []
+    out = None
+    out_path = None
+    written = 0
+
+    try:
+        for chunk in chunks:
+            buf += chunk
+            while True:
+                if state in ('preamble', 'body'):
+                    # bytes.find scans for the boundary in C; the file data is written through
+                    # a memoryview so it isn't copied again on its way to disk
+                    i = buf.find(delimiter)
+                    view = memoryview(buf)
+                    if i == -1:
+                        # Keep enough bytes to match a delimiter split across chunks
+                        keep = len(delimiter) - 1
+                        data, buf = view[:-keep], buf[-keep:]
+                    else:
+                        data, buf = view[:i], buf[i + len(delimiter):]
+                    if out is not None and data:
+                        written += len(data)
+                        if written > MAX_FILE_SIZE:
+                            raise FileTooLarge(f"{os.path.basename(out_path)} exceeds {MAX_FILE_SIZE} bytes")
+                        out.write(data)
+                    if i == -1:
+                        break
+                    if out is not None:
+                        out.close()
+                        out = None  # Complete; the cleanup below must not delete it any more
+                        saved.append(out_path)
+                        if on_saved is not None:
+                            on_saved(out_path)
+                    state = 'boundary'
+                elif state == 'boundary':
+                    if len(buf) < 2:
+                        break
+                    if buf[:2] == b'--':
+                        state = 'done'
+                        break
+                    if buf[:2] != b'\r\n':
+                        raise ValueError("Invalid multipart boundary")
+                    buf = buf[2:]
+                    state = 'headers'
+                elif state == 'headers':
+                    i = buf.find(b'\r\n\r\n')
+                    if i == -1:
+                        if len(buf) > CHUNK_SIZE:
+                            raise ValueError("Multipart part headers too large")
+                        break
+                    headers, buf = buf[:i], buf[i + 4:]
+                    if b'filename="' in headers:
+                        # Extract filename, dropping any client-supplied directories
+                        filename = headers.split(b'filename="')[1].split(b'"')[0].decode(errors='replace')
+                        filename = os.path.basename(filename.replace('\\', '/'))
+                        if filename:
+                            fd, out_path = create_upload_file(filename)
+                            out = open(fd, 'wb')
+                            written = 0
+                    state = 'body'
+                else:
+                    break
+            if state == 'done':
+                break
+    except BaseException:
+        # Don't leave a truncated file behind
+        if out is not None:
+            out.close()
+            os.remove(out_path)
+        raise
+
+    if out is not None:
+        out.close()
+        os.remove(out_path)
+        raise ValueError("Upload ended before the closing boundary")
+    return saved
 
 class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+    # Keep connections open between requests so page loads and image fetches reuse them.
+    # Every response therefore needs a Content-Length or an explicit Connection: close.
+    protocol_version = 'HTTP/1.1'
+    timeout = 60  # Drop connections that go idle so they don't pin a server thread
+
     def do_POST(self):
         if self.path == '/upload':
-            # Handle file upload
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            boundary = self.headers['Content-Type'].split("=")[1].encode()
-            parts = post_data.split(boundary)
-
-            for part in parts:
-                if b'filename=' in part:
-                    try:
-                        # Extract filename
-                        filename = part.split(b'filename=')[1].split(b'\r\n')[0].strip(b'"')
-                        filename = os.path.join(upload_dir, filename.decode())  # Set the file path to the new directory
-
-                        # Save the file correctly in binary mode
-                        with open(filename, 'wb') as f:
-                            file_data = part.split(b'\r\n\r\n')[1].split(b'\r\n')[0]
-                            f.write(file_data)
+            # Handle file upload, streaming each part straight to disk
+            content_type = self.headers.get('Content-Type', '')
+            if 'boundary=' not in content_type:
+                self.send_error(400, 'Expected multipart/form-data')
+                return
+            if self.headers.get('Content-Length') is None:
+                self.send_error(411)
+                return
+            boundary = content_type.split('boundary=')[1].split(';')[0].strip().strip('"').encode()
+            try:
+                content_length = int(self.headers['Content-Length'])
+            except ValueError:
+                content_length = -1
+            if content_length < 0:
+                self.close_connection = True  # Can't tell where the body ends
+                self.send_error(400, 'Invalid Content-Length')
+                return
 
-                        print(f"File {filename} uploaded successfully.")  # Debugging output
+            try:
+                saved = save_multipart(read_body(self.rfile, content_length), boundary, queue_conversion)
+            except FileTooLarge as e:
+                print(f"Upload rejected: {e}")
+                self.close_connection = True  # The rest of the body is left unread
+                self.send_error(413, explain=str(e))  # Keep the client's filename out of the status line
+                return
+            except ValueError as e:
+                print(f"Malformed upload: {e}")
+                self.close_connection = True
+                self.send_error(400, explain=str(e))
+                return
+            except FileExistsError as e:
+                # create_upload_file ran out of attempts at a free name
+                print(f"Error while saving file: {e}")
+                self.close_connection = True
+                self.send_error(409, explain=str(e))  # Keep the client's filename out of the status line
+                return
+            except OSError as e:
+                # The file couldn't be created or written (bad name, disk full, permissions, ...)
+                print(f"Error while saving file: {e}")
+                self.close_connection = True
+                self.send_error(507 if e.errno == errno.ENOSPC else 500, 'Could not save the uploaded file')
+                return
 
-                    except Exception as e:
-                        print(f"Error while saving file: {e}")  # If an error occurs during file saving
+            for filename in saved:
+                print(f"File {filename} uploaded successfully.")  # Debugging output
 
+            body = b'Files uploaded successfully!'
             self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
             self.end_headers()
-            self.wfile.write(b'Files uploaded successfully!')
+            self.wfile.write(body)
             return
+        else:
+            # Always answer, otherwise a kept-alive client waits forever for a response
+            self.send_error(404)
 
     def do_GET(self):
         if self.path == '/':
+            # Only the image list changes between requests; the page shell is prebuilt bytes
+            parts = [PAGE_HEAD]
+            # List uploaded PNG and JPEG files
+            for filename in get_files_by_type()['images']:
+                parts.append(f'<p><img src="/{filename}" alt="{filename}" /></p>\n'.encode())
+            parts.append(PAGE_TAIL)
+            body = b''.join(parts)
+
             self.send_response(200)
             self.send_header('Content-type', 'text/html')
+            self.send_header('Content-Length', str(len(body)))
             self.end_headers()
-            self.wfile.write(b'''
-                <html>
-                <head>
-                    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                    <style>
-                        body { font-family: Arial, sans-serif; padding: 20px; }
-                        h1 { text-align: center; }
-                        form { margin-bottom: 20px; }
-                        input[type="file"], input[type="submit"] { width: 100%; padding: 10px; margin: 10px 0; }
-                        @media (min-width: 600px) {
-                            input[type="file"], input[type="submit"] { width: auto; }
-                        }
-                        img { max-width: 100%; height: auto; }
-                    </style>
-                </head>
-                <body>
-                    <h1>File Sharing Service</h1>
-                    <h2>Upload Files</h2>
-                    <form action="/upload" method="post" enctype="multipart/form-data">
-                        <input type="file" name="file" multiple>
-                        <input type="submit" value="Upload">
-                    </form>
-                    <h2>View Uploaded Files</h2>
-                    <h3>Images</h3>
-                    <div>
-            ''')
+            self.wfile.write(body)  # One send for the whole page
 
-            # List uploaded PNG and JPEG files
-            for filename in os.listdir(upload_dir):
-                if filename.lower().endswith(('png', 'jpg', 'jpeg')):
-                    file_path = os.path.join(upload_dir, filename)
-                    self.wfile.write(f'<p><img src="/{filename}" alt="{filename}" /></p>'.encode())
-
-            self.wfile.write(b'''
-                    </div>
-                    <h2>Download Files</h2>
-                    <form action="/download" method="get">
-                        <input type="submit" value="Download All Files as ZIP">
-                    </form>
-                </body>
-                </html>
-            ''')
+        elif self.path == '/files':
+            # Uploaded file names grouped by type, as JSON
+            body = get_files_json()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
 
         elif self.path == '/download':
-            # Create a zip file of all uploaded files
-            zip_buffer = io.BytesIO()
-            with zipfile.ZipFile(zip_buffer, 'w') as zip_file:
-                for foldername, subfolders, filenames in os.walk(upload_dir):
-                    for filename in filenames:
-                        file_path = os.path.join(foldername, filename)
-                        zip_file.write(file_path, os.path.relpath(file_path, upload_dir))
-            zip_buffer.seek(0)
-
             self.send_response(200)
             self.send_header('Content-Type', 'application/zip')
             self.send_header('Content-Disposition', 'attachment; filename=uploaded_files.zip')
+            # The length isn't known up front, so the connection is closed to end the body
+            self.send_header('Connection', 'close')
             self.end_headers()
-            self.wfile.write(zip_buffer.read())
+
+            # Write the zip of all uploaded files straight to the socket as it is built
+            with zipfile.ZipFile(self.wfile, 'w') as zip_file:
+                for foldername, subfolders, filenames in os.walk(upload_dir):
+                    for filename in filenames:
+                        file_path = os.path.join(foldername, filename)
+                        if file_extension(filename) in PRECOMPRESSED:
+                            compress = zipfile.ZIP_STORED
+                        else:
+                            compress = zipfile.ZIP_DEFLATED
+                        try:
+                            zinfo = zipfile.ZipInfo.from_file(file_path, os.path.relpath(file_path, upload_dir))
+                            zinfo.compress_type = compress
+                            src = open(file_path, 'rb')
+                        except OSError as e:
+                            # The file went away after os.walk listed it (e.g. a PNG that was just
+                            # converted); skip it so the archive still gets its central directory
+                            print(f"Skipping {filename} in download: {e}")
+                            continue
+                        # Copy in 1MB blocks rather than ZipFile.write's 8KB ones to cut per-block overhead
+                        with src, zip_file.open(zinfo, 'w') as dest:
+                            shutil.copyfileobj(src, dest, ZIP_COPY_BUFSIZE)
             return
         else:
             super().do_GET()
 
-with socketserver.TCPServer(("", PORT), CustomHTTPRequestHandler) as httpd:
-    print("serving at port", PORT)
-    httpd.serve_forever()
+    def copyfile(self, source, outputfile):
+        # Serve static files with sendfile() so the kernel copies them from the page cache
+        # straight to the socket; socket.sendfile falls back to send() where unsupported
+        self.connection.sendfile(source)
+
+class FileShareServer(http.server.ThreadingHTTPServer):
+    def server_bind(self):
+        # With several server processes, each binds its own socket to the same port and the
+        # kernel spreads incoming connections across them
+        if WORKERS > 1:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+def serve():
+    # Handle each request on its own thread so a long zip download doesn't block uploads
+    with FileShareServer(("", PORT), CustomHTTPRequestHandler) as httpd:
+        print("serving at port", PORT)
+        httpd.serve_forever()
+
+def start_worker():
+    """Fork a server process and return its pid; the child never returns from here."""
+    pid = os.fork()
+    if pid:
+        return pid
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)  # Undo the supervisor's handler
+    code = 1
+    try:
+        serve()
+    except KeyboardInterrupt:
+        code = 0
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        if _image_pool is not None:
+            _image_pool.shutdown(wait=False)
+        sys.stdout.flush()
+        os._exit(code)
+
+def supervise():
+    """Run WORKERS server processes, restarting any that die, until interrupted or terminated."""
+    # Turn SIGTERM into SystemExit so the children are stopped too rather than orphaned
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    workers = {start_worker() for _ in range(WORKERS)}
+    try:
+        while True:
+            pid, status = os.wait()
+            workers.discard(pid)
+            print(f"Server process {pid} exited with code {os.waitstatus_to_exitcode(status)}; restarting it")
+            time.sleep(1)  # Don't spin if the server can't start at all (e.g. port in use)
+            workers.add(start_worker())
+    except (KeyboardInterrupt, SystemExit):
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in workers:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+
+if __name__ == '__main__':
+    # Call the conversion function when the server starts
+    convert_png_to_jpeg()
+
+    if WORKERS > 1 and not (hasattr(os, 'fork') and hasattr(socket, 'SO_REUSEPORT')):
+        print("WORKERS > 1 needs fork() and SO_REUSEPORT; running a single server process")
+        WORKERS = 1
+
+    if WORKERS > 1:
+        supervise()
+    else:
+        serve()
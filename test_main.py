@@ -0,0 +1,358 @@
+import errno
+import http.client
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+import unittest
+import zipfile
+from unittest import mock
+
+# main.py creates and chdirs into its upload directory on import, so point it somewhere disposable.
+# The path is relative, like the README's example, so image workers that re-import main from
+# inside the upload directory have to resolve it the same way the server did.
+os.chdir(tempfile.mkdtemp(prefix='file_share_test_'))
+os.environ['UPLOAD_DIR'] = 'uploads'
+
+import main  # noqa: E402
+
+
+BOUNDARY = b'----TestBoundary7MA4YWxk'
+
+
+def build_body(files):
+    body = [b'preamble to be ignored']
+    for filename, data in files:
+        body.append(b'\r\n--' + BOUNDARY + b'\r\n')
+        body.append(b'Content-Disposition: form-data; name="file"; filename="' + filename.encode() + b'"\r\n')
+        body.append(b'Content-Type: application/octet-stream\r\n\r\n')
+        body.append(data)
+    body.append(b'\r\n--' + BOUNDARY + b'--\r\n')
+    return b''.join(body)
+
+
+def rechunk(body, rng):
+    chunks = []
+    i = 0
+    while i < len(body):
+        n = rng.randint(1, 3 * len(BOUNDARY))
+        chunks.append(body[i:i + n])
+        i += n
+    return chunks
+
+
+class FileExtensionTest(unittest.TestCase):
+    def test_file_extension(self):
+        self.assertEqual(main.file_extension('Photo.PNG'), '.png')
+        self.assertEqual(main.file_extension('archive.tar.gz'), '.gz')
+        self.assertEqual(main.file_extension('README'), '')
+        self.assertEqual(main.file_extension('.png'), '')  # A dotfile, not a PNG
+
+
+class SaveMultipartTest(unittest.TestCase):
+    def setUp(self):
+        for name in os.listdir(main.upload_dir):
+            os.remove(os.path.join(main.upload_dir, name))
+
+    def test_random_chunking(self):
+        rng = random.Random(1234)
+        # Data that contains near-misses of the delimiter, including at the very end of a part
+        tricky = b'\r\n--' + BOUNDARY[:-1] + b'x\r\n-' + b'\r\n--'
+        for trial in range(50):
+            self.setUp()
+            files = [
+                (f'file{i}.bin', rng.randbytes(rng.randint(0, 2000)) + tricky + rng.randbytes(rng.randint(0, 50)))
+                for i in range(3)
+            ]
+            files.append(('empty.txt', b''))
+            files.append(('ends_with_delimiter_prefix.txt', b'data' + tricky))
+            body = build_body(files)
+
+            saved = main.save_multipart(iter(rechunk(body, rng)), BOUNDARY)
+
+            self.assertEqual([os.path.basename(p) for p in saved], [name for name, _ in files])
+            for name, data in files:
+                with open(os.path.join(main.upload_dir, name), 'rb') as f:
+                    self.assertEqual(f.read(), data, f"trial {trial}: {name}")
+
+    def test_failing_on_saved_keeps_completed_file(self):
+        def on_saved(path):
+            raise RuntimeError('callback failed')
+
+        body = build_body([('done.txt', b'complete')])
+        with self.assertRaises(RuntimeError):
+            main.save_multipart(iter([body]), BOUNDARY, on_saved)
+        with open(os.path.join(main.upload_dir, 'done.txt'), 'rb') as f:
+            self.assertEqual(f.read(), b'complete')
+
+    def test_truncated_body_removes_partial_file(self):
+        body = build_body([('partial.bin', b'x' * 1000)])
+        with self.assertRaises(ValueError):
+            main.save_multipart(iter([body[:-200]]), BOUNDARY)
+        self.assertEqual(os.listdir(main.upload_dir), [])
+
+    def test_oversized_file_is_rejected(self):
+        body = build_body([('big.bin', b'x' * 1000)])
+        old_limit = main.MAX_FILE_SIZE
+        main.MAX_FILE_SIZE = 100
+        try:
+            with self.assertRaises(main.FileTooLarge):
+                main.save_multipart(iter([body]), BOUNDARY)
+        finally:
+            main.MAX_FILE_SIZE = old_limit
+        self.assertEqual(os.listdir(main.upload_dir), [])
+
+
+class CreateUploadFileTest(unittest.TestCase):
+    def setUp(self):
+        for name in os.listdir(main.upload_dir):
+            os.remove(os.path.join(main.upload_dir, name))
+
+    def test_existing_name_gets_suffix(self):
+        fd, first = main.create_upload_file('photo.jpg')
+        os.close(fd)
+        fd, second = main.create_upload_file('photo.jpg')
+        os.close(fd)
+        self.assertEqual(os.path.basename(first), 'photo.jpg')
+        self.assertNotEqual(first, second)
+        self.assertTrue(os.path.basename(second).startswith('photo_'))
+        self.assertTrue(second.endswith('.jpg'))
+
+    def test_gives_up_with_file_exists_error(self):
+        for name in ('a.txt', 'a_same.txt'):
+            open(os.path.join(main.upload_dir, name), 'w').close()
+        old_token_hex = main.secrets.token_hex
+        main.secrets.token_hex = lambda n: 'same'  # Every retry collides with a_same.txt
+        try:
+            with self.assertRaises(FileExistsError):
+                main.create_upload_file('a.txt')
+        finally:
+            main.secrets.token_hex = old_token_hex
+
+
+class ConvertToJpegTest(unittest.TestCase):
+    def setUp(self):
+        for name in os.listdir(main.upload_dir):
+            os.remove(os.path.join(main.upload_dir, name))
+
+    def test_does_not_overwrite_existing_jpeg(self):
+        existing = os.path.join(main.upload_dir, 'photo.jpg')
+        with open(existing, 'wb') as f:
+            f.write(b'original jpeg')
+        png_path = os.path.join(main.upload_dir, 'photo.png')
+        main.Image.new('RGBA', (20, 10)).save(png_path)
+
+        main.convert_to_jpeg(png_path)
+
+        with open(existing, 'rb') as f:
+            self.assertEqual(f.read(), b'original jpeg')
+        names = os.listdir(main.upload_dir)
+        self.assertNotIn('photo.png', names)
+        converted = [name for name in names if name != 'photo.jpg']
+        self.assertEqual(len(converted), 1)
+        self.assertTrue(converted[0].startswith('photo_') and converted[0].endswith('.jpg'))
+        with main.Image.open(os.path.join(main.upload_dir, converted[0])) as img:
+            self.assertEqual((img.format, img.size), ('JPEG', (20, 10)))
+
+    def test_keeps_full_resolution(self):
+        # The JPEG replaces the uploaded PNG, so it must not be downscaled
+        png_path = os.path.join(main.upload_dir, 'wide.png')
+        main.Image.new('RGB', (3000, 1500)).save(png_path)
+        main.convert_to_jpeg(png_path)
+        with main.Image.open(os.path.join(main.upload_dir, 'wide.jpg')) as img:
+            self.assertEqual(img.size, (3000, 1500))
+
+    def test_conversion_through_image_pool(self):
+        png_path = os.path.join(main.upload_dir, 'pic.png')
+        main.Image.new('RGB', (20, 10)).save(png_path)
+        try:
+            main.get_image_pool().submit(main.convert_to_jpeg, png_path).result(timeout=60)
+        finally:
+            main._image_pool.shutdown()
+            main._image_pool = None
+
+        self.assertEqual(sorted(os.listdir(main.upload_dir)), ['pic.jpg'])
+
+
+class QuietHandler(main.CustomHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class ServerTestCase(unittest.TestCase):
+    """Runs the real server on an ephemeral port for the duration of the test class."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = main.FileShareServer(('127.0.0.1', 0), QuietHandler)
+        cls.port = cls.server.server_address[1]
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        for name in os.listdir(main.upload_dir):
+            os.remove(os.path.join(main.upload_dir, name))
+
+    def request(self, method, path, body=None, headers=None):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=10)
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            response = conn.getresponse()
+            return response, response.read()
+        finally:
+            conn.close()
+
+
+class FramingTest(ServerTestCase):
+    def test_keep_alive_upload_then_page(self):
+        # Both responses must be length-delimited for the second one to be read off the same connection
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=10)
+        try:
+            headers = {'Content-Type': 'multipart/form-data; boundary=' + BOUNDARY.decode()}
+            conn.request('POST', '/upload', build_body([('notes.txt', b'hello')]), headers)
+            response = conn.getresponse()
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.getheader('Content-Length'), str(len(response.read())))
+
+            conn.request('GET', '/')
+            response = conn.getresponse()
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.getheader('Content-Length'), str(len(response.read())))
+        finally:
+            conn.close()
+
+    def test_download_closes_connection(self):
+        # The zip is streamed without a length, so the end of the body is the end of the connection
+        response, body = self.request('GET', '/download')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.getheader('Connection'), 'close')
+        with zipfile.ZipFile(io.BytesIO(body)) as archive:
+            self.assertEqual(archive.namelist(), [])
+
+    def test_unknown_post_path(self):
+        response, body = self.request('POST', '/nowhere', b'data')
+        self.assertEqual(response.status, 404)
+
+
+class DownloadTest(ServerTestCase):
+    def test_file_removed_during_download_is_skipped(self):
+        with open(os.path.join(main.upload_dir, 'kept.txt'), 'wb') as f:
+            f.write(b'still here')
+        # Simulate a file that os.walk listed but that was deleted before it was archived
+        listing = [(main.upload_dir, [], ['gone.png', 'kept.txt'])]
+        with mock.patch.object(main.os, 'walk', return_value=listing):
+            response, body = self.request('GET', '/download')
+
+        self.assertEqual(response.status, 200)
+        with zipfile.ZipFile(io.BytesIO(body)) as archive:
+            self.assertEqual(archive.namelist(), ['kept.txt'])
+            self.assertEqual(archive.read('kept.txt'), b'still here')
+
+
+class FilesTest(ServerTestCase):
+    def touch_upload_dir(self):
+        # Directory mtimes can be coarser than the gap between two changes; force a new one
+        st = os.stat(main.upload_dir)
+        os.utime(main.upload_dir, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+    def get_files(self):
+        response, body = self.request('GET', '/files')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.getheader('Content-Type'), 'application/json')
+        self.assertEqual(int(response.getheader('Content-Length')), len(body))
+        return {group: sorted(names) for group, names in json.loads(body).items()}
+
+    def test_groups_and_cache_follow_directory_changes(self):
+        for name in ('a.PNG', 'b.pdf', 'c.mp4', 'd.xyz', 'README'):
+            open(os.path.join(main.upload_dir, name), 'w').close()
+        os.mkdir(os.path.join(main.upload_dir, 'sub.png'))  # Directories are not listed
+        self.touch_upload_dir()
+        self.assertEqual(self.get_files(), {
+            'images': ['a.PNG'], 'documents': ['b.pdf'], 'media': ['c.mp4'], 'other': ['README', 'd.xyz'],
+        })
+
+        open(os.path.join(main.upload_dir, 'e.jpg'), 'w').close()
+        self.touch_upload_dir()
+        self.assertEqual(self.get_files()['images'], ['a.PNG', 'e.jpg'])
+
+        os.remove(os.path.join(main.upload_dir, 'b.pdf'))
+        os.rmdir(os.path.join(main.upload_dir, 'sub.png'))
+        self.touch_upload_dir()
+        self.assertEqual(self.get_files()['documents'], [])
+
+
+class UploadErrorTest(ServerTestCase):
+    def upload(self, files):
+        headers = {'Content-Type': 'multipart/form-data; boundary=' + BOUNDARY.decode()}
+        return self.request('POST', '/upload', build_body(files), headers)
+
+    def test_missing_boundary(self):
+        response, body = self.request('POST', '/upload', b'data', {'Content-Type': 'text/plain'})
+        self.assertEqual(response.status, 400)
+
+    def test_missing_content_length(self):
+        headers = {'Content-Type': 'multipart/form-data; boundary=' + BOUNDARY.decode(),
+                   'Transfer-Encoding': 'chunked'}
+        response, body = self.request('POST', '/upload', headers=headers)
+        self.assertEqual(response.status, 411)
+
+    def test_invalid_content_length(self):
+        for value in ('abc', '-1'):
+            headers = {'Content-Type': 'multipart/form-data; boundary=' + BOUNDARY.decode(),
+                       'Content-Length': value}
+            response, body = self.request('POST', '/upload', headers=headers)
+            self.assertEqual(response.status, 400)
+
+    def test_malformed_body(self):
+        headers = {'Content-Type': 'multipart/form-data; boundary=' + BOUNDARY.decode()}
+        response, body = self.request('POST', '/upload', build_body([('cut.bin', b'x' * 100)])[:-20], headers)
+        self.assertEqual(response.status, 400)
+        self.assertEqual(os.listdir(main.upload_dir), [])
+
+    def test_unwritable_name(self):
+        response, body = self.upload([('x' * 300 + '.txt', b'data')])  # Longer than NAME_MAX
+        self.assertEqual(response.status, 500)
+
+    def test_disk_full(self):
+        full = OSError(errno.ENOSPC, 'No space left on device')
+        with mock.patch.object(main, 'create_upload_file', side_effect=full):
+            response, body = self.upload([('notes.txt', b'data')])
+        self.assertEqual(response.status, 507)
+
+    def test_too_large_with_hostile_filename(self):
+        old_limit = main.MAX_FILE_SIZE
+        main.MAX_FILE_SIZE = 10
+        try:
+            for filename in ('日本.bin', 'a\r\nSet-Cookie: pwned=1.bin'):
+                response, body = self.upload([(filename, b'x' * 100)])
+                self.assertEqual(response.status, 413)
+                self.assertEqual(response.reason, 'Request Entity Too Large')
+                self.assertIsNone(response.getheader('Set-Cookie'))
+        finally:
+            main.MAX_FILE_SIZE = old_limit
+        self.assertEqual(os.listdir(main.upload_dir), [])
+
+    def test_no_free_name_with_hostile_filename(self):
+        old_token_hex = main.secrets.token_hex
+        main.secrets.token_hex = lambda n: 'same'  # Every retry collides
+        try:
+            for filename in ('日本.bin', 'a\r\nSet-Cookie: pwned=1.bin'):
+                stem, suffix = os.path.splitext(filename)
+                for name in (filename, f'{stem}_same{suffix}'):
+                    open(os.path.join(main.upload_dir, name), 'w').close()
+                response, body = self.upload([(filename, b'data')])
+                self.assertEqual(response.status, 409)
+                self.assertEqual(response.reason, 'Conflict')
+                self.assertIsNone(response.getheader('Set-Cookie'))
+        finally:
+            main.secrets.token_hex = old_token_hex
+
+
+if __name__ == '__main__':
+    unittest.main()